@@ -36,3 +36,4 @@ class TaskAdmin(admin.ModelAdmin):
 @admin.register(Entry)
 class EntryAdmin(admin.ModelAdmin):
     list_display = ['id', 'task', 'user']
+    list_select_related = ['task', 'user']
@@ -1,19 +1,45 @@
 # Generated by Django 2.2.5 on 2019-11-14 16:42
 
-from django.db import migrations
+from django.db import migrations, transaction, DataError
+from django.db.models import F
+from django.db.models.functions import Cast
+
+import moonsheep.json_field
+
+BATCH_SIZE = 1000
+
+
+def copy_field(model, source, target):
+    try:
+        # Copy is done in one UPDATE; source column is text, so cast it to jsonb
+        with transaction.atomic():
+            model.objects.update(**{target: Cast(F(source), output_field=moonsheep.json_field.JSONField())})
+        return
+    except DataError:
+        # Some rows are not valid JSON, copy them in Python where JSONTextField keeps such values as raw strings
+        pass
+
+    batch = []
+    for obj in model.objects.only('id', source).iterator(chunk_size=2 * BATCH_SIZE):
+        setattr(obj, target, getattr(obj, source))
+        batch.append(obj)
+
+        if len(batch) >= BATCH_SIZE:
+            model.objects.bulk_update(batch, [target])
+            batch = []
+
+    if batch:
+        model.objects.bulk_update(batch, [target])
+
 
 def copy_json_fields(apps, schema_editor):
     # We can't import the Person model directly as it may be a newer
     # version than this migration expects. We use the historical version.
     Task = apps.get_model('moonsheep', 'Task')
-    for t in Task.objects.all():
-        t.params2 = t.params
-        t.save()
+    copy_field(Task, 'params', 'params2')
 
     Entry = apps.get_model('moonsheep', 'Entry')
-    for e in Entry.objects.all():
-        e.data2 = e.data
-        e.save()
+    copy_field(Entry, 'data', 'data2')
 
 class Migration(migrations.Migration):
 
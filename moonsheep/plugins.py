@@ -18,6 +18,7 @@ Copy method stubs from interface and implement them.
 """
 import inspect
 from abc import ABC
+from functools import lru_cache
 from typing import Dict, Type
 
 from pyutilib.component.core import Interface as _pca_Interface, ExtensionPoint as PluginImplementations, \
@@ -74,6 +75,17 @@ class Interface(ABC):
 
     @classmethod
     def implementations(cls) -> Dict[str, Type['Interface']]:
+        """
+        Implementations are looked up once per interface, as they are defined when modules are imported.
+        Subclasses defined after the first call won't be seen.
+
+        :return: new dict of slug -> implementing class
+        """
+        return dict(cls._implementations())
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def _implementations(cls) -> Dict[str, Type['Interface']]:
         implementations = {}
         for subclass in _all_subclasses(cls):
             if inspect.isabstract(subclass):
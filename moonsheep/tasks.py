@@ -21,6 +21,12 @@ class AbstractTask(object):
     params: JSONField
     instance: Task
 
+    template_name: str = None
+    """Template showing the task, required unless TaskView defines one"""
+
+    task_form = None
+    """Form validating entries, if not set entries are saved without validation"""
+
     def __init__(self, instance: Task):
         self.instance = instance
         self.id = instance.id  # TODO attr rather than field
@@ -75,12 +81,13 @@ class AbstractTask(object):
 
         # Do the crosscheck if we have enough entries
         # TODO is task_id needed? we have self.instance.id
-        entries = Entry.objects.filter(task_id=task_id)
-        entries_count = entries.count()
+        # There are just a few entries per task, so fetch them at once rather than counting them first
+        entries_data = list(Entry.objects.filter(task_id=task_id).values_list('data', flat=True))
+        entries_count = len(entries_data)
 
         if entries_count >= MOONSHEEP['MIN_ENTRIES_TO_CROSSCHECK']:
             # So far we only take real data into account but in the future Verifiers might want also to look at users' "trustworthiness"
-            crosschecked, confidence = self.cross_check(list([entry.data for entry in entries]))
+            crosschecked, confidence = self.cross_check(entries_data)
             # TODO record somewhere on how many entries the crosscheck was done, update values if new crosscheck comes with higher rank?
 
             verified = confidence >= MIN_CONFIDENCE  # TODO MIN_CONFIDENCE configurable
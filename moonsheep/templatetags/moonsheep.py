@@ -1,4 +1,3 @@
-import os
 import urllib.parse
 
 from django.template import Library
@@ -34,9 +33,36 @@ def task_name(value):
 @register.filter
 @stringfilter
 def pretty_url(value):
-    return urllib.parse.unquote(os.path.basename(value))
+    name = value.rsplit('/', 1)[-1]
+    # most of file names are not quoted
+    if '%' not in name:
+        return name
+    return urllib.parse.unquote(name)
 
 
-register.simple_tag(stats_documents_verified)
+def cached_per_request(func):
+    """
+    Run the function once per request, even if the tag is used several times in templates
+    """
 
-register.simple_tag(stats_users)
+    def _tag(context):
+        request = getattr(context, 'request', None)
+        if request is None:
+            return func()
+
+        cache = getattr(request, '_moonsheep_tags_cache', None)
+        if cache is None:
+            cache = {}
+            setattr(request, '_moonsheep_tags_cache', cache)
+
+        if func.__name__ not in cache:
+            cache[func.__name__] = func()
+        return cache[func.__name__]
+
+    _tag.__doc__ = func.__doc__
+    return _tag
+
+
+register.simple_tag(cached_per_request(stats_documents_verified), takes_context=True, name='stats_documents_verified')
+
+register.simple_tag(cached_per_request(stats_users), takes_context=True, name='stats_users')
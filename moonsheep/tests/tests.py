@@ -4,6 +4,7 @@ from random import randint
 from django.core.exceptions import ImproperlyConfigured, ValidationError
 from django.db import models
 from django.http.request import QueryDict
+from django.template import Engine, RequestContext
 from django.test import TestCase as DjangoTestCase, Client, RequestFactory, override_settings
 from django.urls import reverse
 
@@ -13,9 +14,10 @@ from unittest.mock import MagicMock, patch, sentinel, call
 from moonsheep.exceptions import PresenterNotDefined, TaskMustSetTemplate, NoTasksLeft
 from moonsheep.forms import MultipleRangeField
 from moonsheep.mapper import ModelMapper
+from moonsheep.models import User
 from moonsheep.tasks import AbstractTask
 from moonsheep.verifiers import equals, OrderedListVerifier
-from moonsheep.views import unpack_post, TaskView
+from moonsheep.views import unpack_post, TaskView, ChooseNicknameView
 
 
 class DummyAbstracTask(AbstractTask):
@@ -665,6 +667,64 @@ class UnpackPostTest(UnitTestCase):
             }]
         })
 
+    def test_field_name_not_valid(self):
+        for name in ['a[]x', 'a[][]', 'a[b', 'a[b[c]', 'a]', '', 'a[b.c]', 'a b']:
+            with self.subTest(name=name):
+                post = QueryDict(mutable=True)
+                post[name] = 'val'
+                with self.assertRaisesRegex(Exception, 'Field name not valid'):
+                    unpack_post(post)
+
+    def test_rows_non_decimal_digit_index(self):
+        """
+        Digits like superscripts are not numbers for int(), so object is not converted to list
+        """
+        post = QueryDict('row[²][fld]=x')
+        self.assertDictEqual(unpack_post(post), {
+            'row': {
+                '²': {'fld': 'x'}
+            }
+        })
+
+
+class StatsTagsTest(UnitTestCase):
+    @patch('moonsheep.statistics.connections')
+    def test_stats_users_once_per_request(self, connections_mock: MagicMock):
+        cursor = connections_mock['default'].connection.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = {'registered': 3, 'participated': 2, 'entries_total': 5}
+
+        template = Engine(libraries={'moonsheep': 'moonsheep.templatetags.moonsheep'}).from_string(
+            '{% load moonsheep %}{% stats_users as users %}{{ users.registered }} {% stats_users as users %}{{ users.participated }}')
+        rendered = template.render(RequestContext(RequestFactory().get('/')))
+
+        self.assertEqual(rendered, '3 2')
+        cursor.execute.assert_called_once()
+
+
+@override_settings(ROOT_URLCONF='moonsheep.urls')
+class ChooseNicknameViewTest(DjangoTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.view = ChooseNicknameView.as_view(template_name='nickname.html')
+
+    @patch('moonsheep.views.login')
+    def test_nickname_taken(self, login_mock: MagicMock):
+        User.objects.create_pseudonymous(nickname='moonsheep')
+
+        response = self.view(self.factory.get('/get-a-nickname', {'nickname': 'moonsheep'}))
+
+        login_mock.assert_not_called()
+        self.assertTrue(response.context_data['nickname_taken'])
+        self.assertEqual(User.objects.filter(nickname='moonsheep').count(), 1)
+
+    @patch('moonsheep.views.login')
+    def test_nickname_free(self, login_mock: MagicMock):
+        response = self.view(self.factory.get('/get-a-nickname', {'nickname': 'moonsheep'}))
+
+        login_mock.assert_called_once()
+        self.assertEqual(login_mock.call_args[0][1], User.objects.get(nickname='moonsheep'))
+        self.assertEqual(response.status_code, 302)
+
 
 @override_settings(ROOT_URLCONF='moonsheep.urls')
 class TaskProcessingTests(DjangoTestCase):
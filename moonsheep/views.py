@@ -1,13 +1,11 @@
 import os
-import random
-import re
 import tempfile
-from typing import Sequence
+from collections import defaultdict
 
-import dpath.util
 from django.contrib import messages
 from django.contrib.auth import login
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
 from django.http import HttpResponseRedirect, Http404, FileResponse
 from django.http.request import QueryDict
 from django.shortcuts import redirect
@@ -125,20 +123,20 @@ class TaskView(UserRequiredMixin, FormView):
         # By default it uses moonsheep/templates/task.html
 
         # Overriding template
-        if hasattr(self.task_type, 'template_name'):
+        if self.task_type and self.task_type.template_name:
             self.template_name = self.task_type.template_name
 
         if not self.template_name:
             raise TaskMustSetTemplate(self.task_type.__class__)
 
-        self.form_class = getattr(self.task_type, 'task_form', None)
+        self.form_class = self.task_type.task_form if self.task_type else None
 
     # =====================
     # Override FormView to adapt for a case when user hasn't defined form for a given task
     # and to process form in our own manner
 
     def get_form_class(self):
-        return self.task_type.task_form if hasattr(self.task_type, 'task_form') else None
+        return self.task_type.task_form if self.task_type else None
 
     def get_form(self, form_class=None):
         """Return an instance of the form to be used in this view.
@@ -199,9 +197,7 @@ class TaskView(UserRequiredMixin, FormView):
                     + "# Keep it to make Moonsheep aware of defined tasks")
 
             # Rotate tasks one after another
-            TaskView.__mocked_task_counter += 1
-            if TaskView.__mocked_task_counter >= len(defined_tasks):
-                TaskView.__mocked_task_counter = 0
+            TaskView.__mocked_task_counter = (TaskView.__mocked_task_counter + 1) % len(defined_tasks)
             task_type = defined_tasks[TaskView.__mocked_task_counter]
 
         task_class = klass_from_name(task_type)
@@ -232,15 +228,22 @@ class TaskView(UserRequiredMixin, FormView):
         # TODO implement priority setting (how to set priority for the imported task?)
 
         # TODO test exclude works properly
-        tasks = Task.objects.filter(state=Task.OPEN).exclude(entry__user=self.request.user).order_by('-priority')[:20]
-
-        if not tasks:
-            raise NoTasksLeft()
+        top_tasks = Task.objects.filter(state=Task.OPEN) \
+            .annotate(contributed=Exists(Entry.objects.filter(task=OuterRef('pk'), user=self.request.user))) \
+            .filter(contributed=False) \
+            .order_by('-priority') \
+            .values('pk')[:20]
 
         # choose task at random from the top 20, so everyone won't get the same task
         # TODO otherwise an "open_count" could help to limit it,
         #  especially where there are a lot of volunteers and long tasks
-        return random.choice(tasks)
+        task = Task.objects.filter(pk__in=top_tasks).order_by('?') \
+            .only('id', 'type', 'params', 'doc_id').first()
+
+        if task is None:
+            raise NoTasksLeft()
+
+        return task
 
     def _save_entry(self, task_id, data) -> None:
         """
@@ -259,7 +262,7 @@ class TaskView(UserRequiredMixin, FormView):
             return
 
         # Create new entry
-        Entry(task_id=task_id, user=self.request.user, data=data).save()
+        Entry.objects.create(task_id=task_id, user=self.request.user, data=data)
 
         # Run verification, saving, progress updates
         self.task_type.verify_and_save(task_id)
@@ -270,9 +273,8 @@ class TaskView(UserRequiredMixin, FormView):
             linkclose='</a>'))
 
     def _get_user_ip(self):
-        return self.request.META.get(
-            'HTTP_X_FORWARDED_FOR', self.request.META.get('REMOTE_ADDR')
-        ).split(',')[-1].strip()
+        ip = self.request.META.get('HTTP_X_FORWARDED_FOR') or self.request.META.get('REMOTE_ADDR', '')
+        return ip.rpartition(',')[2].strip()
 
 
 class ManualVerificationView(TaskView):
@@ -284,21 +286,16 @@ class ManualVerificationView(TaskView):
         context = super().get_context_data(**kwargs)
 
         # Get all entries and their confidence to support moderator's decision
-        entries: Sequence[Entry] = self.task_type.instance.entry_set.all()
+        entries_data = self.task_type.instance.entry_set.values_list('data', flat=True)
 
         # Repack them as options for each field
-        fields = {}
-        for e in entries:
-            for fld, value in e.data.items():
-                values = fields.get(fld, set())
-                values.add(value)
-                fields[fld] = values
-
-        for fld, values in fields.items():
-            fields[fld] = list(values)
+        fields = defaultdict(set)
+        for data in entries_data:
+            for fld, value in data.items():
+                fields[fld].add(value)
 
         context.update({
-            'entries_data': fields
+            'entries_data': {fld: list(values) for fld, values in fields.items()}
         })
 
         return context
@@ -325,9 +322,8 @@ class ManualVerificationView(TaskView):
         """
 
         # Create new entry
-        e = Entry(task_id=task_id, user=self.request.user, data=data, closed_manually=True)
         # TODO don't crosscheck entries that have been manually checked, we might accidentally overwrite data
-        e.save()
+        e = Entry.objects.create(task_id=task_id, user=self.request.user, data=data, closed_manually=True)
 
         # Run verification, saving, progress updates
         self.task_type.verified_manually(task_id, e)
@@ -374,21 +370,22 @@ class DocumentListView(TemplateView):
 
             get_doc_details = int(get_doc_details)
 
-            tasks = Task.objects.filter(doc_id=get_doc_details).order_by('id')
+            # Plain dicts are enough for the template
+            tasks = Task.objects.filter(doc_id=get_doc_details).order_by('id') \
+                .values('id', 'parent_id', 'type', 'state', 'own_progress', 'total_progress')
 
-            nodes = {None: {'children': []}}
+            # children lists by parent task id
+            children = {None: []}
             for t in tasks:
                 node = {
                     "task": t,
-                    "children": []
+                    "children": children.setdefault(t['id'], [])
                 }
-                # Register node
-                nodes[t.id] = node
                 # Add it to parent node
-                nodes[t.parent_id]['children'].append(node)
+                children.setdefault(t['parent_id'], []).append(node)
 
             context.update({
-                'progress_tree': nodes[None],
+                'progress_tree': {'children': children[None]},
                 'details_doc_id': get_doc_details
             })
 
@@ -431,15 +428,21 @@ class ExporterView(View):
         app_label = MOONSHEEP["APP"]
         exp: FileExporter = exporter_cls(app_label)
         # TODO frictionless supporting writing to existing writer/opened file
-        temp_dir = tempfile.mkdtemp()
         # TODO exporters should have the option to generate a default file name
-        temp_file = os.path.join(temp_dir, app_label + ('.xlsx' if kwargs['slug'] == 'xlsx' else '.tar.gz'))
+        extension = '.xlsx' if kwargs['slug'] == 'xlsx' else '.tar.gz'
+        with tempfile.NamedTemporaryFile(suffix=extension, delete=False) as temp_file:
+            pass
         # TODO frictionless checks file extension. it should operate by default as "save to one file packed"
         # or we should create an option for that
         # Decide how exporters should behave
-        exp.export(temp_file)
+        try:
+            exp.export(temp_file.name)
+            response = FileResponse(open(temp_file.name, 'rb'), as_attachment=True, filename=app_label + extension)
+        finally:
+            # The opened handle keeps the content readable until the response is closed
+            os.unlink(temp_file.name)
 
-        return FileResponse(open(temp_file, 'rb'), as_attachment=True)
+        return response
 
 
 class ChooseNicknameView(TemplateView):
@@ -451,13 +454,17 @@ class ChooseNicknameView(TemplateView):
             # try to create user with given nickname & login
             user = None
             try:
-                user = User.objects.create_pseudonymous(nickname=nickname)
+                with transaction.atomic():
+                    user = User.objects.create_pseudonymous(nickname=nickname)
             except IntegrityError:
+                # nickname or another nickname with the same email slug is taken
+                pass
+
+            if not user:
                 context.update({
                     'nickname_taken': True
                 })
-
-            if user:
+            else:
                 # Attach user to the current session
                 login(request, user)
 
@@ -472,6 +479,50 @@ class ChooseNicknameView(TemplateView):
         return self.render_to_response(context)
 
 
+def _is_word(s: str) -> bool:
+    # Same as [\w\-]+ regex
+    return s.replace('-', '_').replace('_', 'a').isalnum()
+
+
+def _parse_field_name(name: str):
+    """
+    Split POST field name into its parts, ie. row[0][entry_options][] -> ('row', ['0', 'entry_options'], True)
+
+    :param name: field name
+    :return: tuple (object, selectors, trailing_brackets) or None if name is not valid
+    """
+    pos = name.find('[')
+    if pos < 0:
+        pos = len(name)
+
+    obj = name[:pos]
+    if not _is_word(obj):
+        return None
+
+    selectors = []
+    trailing_brackets = False
+    while pos < len(name):
+        # nothing can follow trailing brackets
+        if trailing_brackets or name[pos] != '[':
+            return None
+
+        end = name.find(']', pos + 1)
+        if end < 0:
+            return None
+
+        selector = name[pos + 1:end]
+        if not selector:
+            trailing_brackets = True
+        elif _is_word(selector):
+            selectors.append(selector)
+        else:
+            return None
+
+        pos = end + 1
+
+    return obj, selectors, trailing_brackets
+
+
 def unpack_post(post: QueryDict) -> dict:
     """
     Unpack items in POST fields that have multiple occurences.
@@ -495,48 +546,45 @@ def unpack_post(post: QueryDict) -> dict:
     :return: dictionary representing the object passed in POST
     """
 
-    dpath_separator = '/'
     result = {}
     convert_to_array_paths = set()
 
     for k in post.keys():
         # analyze field name
-        m = re.search(r"^" +
-                      "(?P<object>[\w\-_]+)" +
-                      "(?P<selectors>(\[[\d\w\-_]+\])*)" +
-                      "(?P<trailing_brackets>\[\])?" +
-                      "$", k)
-        if not m:
+        parsed = _parse_field_name(k)
+        if not parsed:
             raise Exception("Field name not valid: {}".format(k))
 
-        path = m.group('object')
-        if m.group('selectors'):
-            for ms in re.finditer(r'\[([\d\w\-_]+)\]', m.group('selectors')):
-                # if it is integer then make sure list is created
-                idx = ms.group(1)
-                if re.match(r'\d+', idx):
-                    convert_to_array_paths.add(path)
+        obj, selectors, trailing_brackets = parsed
+        path = (obj,)
+        for idx in selectors:
+            # if it is integer then make sure list is created
+            if idx.isdecimal():
+                convert_to_array_paths.add(path)
 
-                path += dpath_separator + idx
+            path += (idx,)
 
         def get_list_or_value(post, key):
             val = post.getlist(key)
             # single element leave single unless developer put brackets
-            if len(val) == 1 and not m.group('trailing_brackets'):
+            if len(val) == 1 and not trailing_brackets:
                 val = val[0]
             return val
 
-        dpath.util.new(result, path, get_list_or_value(post, k), separator=dpath_separator)
+        node = result
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node[path[-1]] = get_list_or_value(post, k)
 
-    # dpath only works on dicts, but sometimes we want arrays
+    # Tree is built of dicts, but sometimes we want arrays
     # ie. row[0][fld]=0&row[1][fld]=1 results in row { "0": {}, "1": {} } instead of row [ {}, {} ]
-    for path_to_d in convert_to_array_paths:
-        arr = []
-        d = dpath.util.get(result, path_to_d)
-        numeric_keys = [int(k_int) for k_int in d.keys()]
-        for k_int in sorted(numeric_keys):
-            arr.append(d[str(k_int)])
-
-        dpath.util.set(result, path_to_d, arr)
+    # Deepest paths go first, so the ones above are still dicts while we walk them
+    for path_to_d in sorted(convert_to_array_paths, key=len, reverse=True):
+        parent = result
+        for key in path_to_d[:-1]:
+            parent = parent[key]
+
+        d = parent[path_to_d[-1]]
+        parent[path_to_d[-1]] = [d[k_int] for k_int in sorted(d.keys(), key=int)]
 
     return result
@@ -31,7 +31,6 @@ setup(
     license='AGPL-3.0',
     install_requires=[
         'Django>=2.2',
-        'dpath~=1.4',
         'djangorestframework~=3.10',
         'djangorestframework-jsonapi~=2.8',
         'django-filter~=2.2',